@@ -5,19 +5,40 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from google.oauth2 import id_token
 from google_auth_oauthlib.flow import Flow
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import logging
 
-from .utils.helper import parse_csv_content
+from .utils.helper import get_sheets_service, parse_csv_stream
 from .utils.import_transactions import preview_all_transactions, commit_all_previews
 import os
 
 load_dotenv()
 
-app = FastAPI(root_path="/api")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the Sheets credentials and client on cold start so the first
+    # import request doesn't pay for them.
+    try:
+        await asyncio.to_thread(get_sheets_service)
+    except Exception as e:
+        logger.warning("Sheets service warm-up failed: %s", e)
+    yield
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
 
 backend_url = os.getenv("BACKEND_URL")
 frontend_url = os.getenv("FRONTEND_URL")
+client_id = os.getenv("GOOGLE_CLIENT_ID")
+client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
 
 origins = []
 
@@ -47,8 +68,8 @@ def get_oauth_flow():
 
     client_config = {
         "web": {
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+            "client_id": client_id,
+            "client_secret": client_secret,
             "auth_uri": "https://accounts.google.com/o/oauth2/auth",
             "token_uri": "https://oauth2.googleapis.com/token",
             "redirect_uris": [redirect_uri]
@@ -100,23 +121,18 @@ def google_callback(code: str = None, error: str = None):
 
         credentials = flow.credentials
 
-        # Get user info to verify email
-        import requests
-        userinfo_response = requests.get(
-            "https://www.googleapis.com/oauth2/v1/userinfo",
-            headers={"Authorization": f"Bearer {credentials.token}"}
+        # The token exchange already returned an OpenID Connect ID token
+        # (openid scope); verifying it locally replaces the extra HTTP call
+        # to the userinfo endpoint.
+        claims = id_token.verify_oauth2_token(
+            credentials.id_token, GoogleAuthRequest(), client_id
         )
 
-        if userinfo_response.status_code != 200:
-            return RedirectResponse(f"{frontend_url}/?auth_error=failed_user_info")
-
-        user_info = userinfo_response.json()
-
         # Encode user data
         user_data = {
-            "email": user_info.get("email"),
-            "name": user_info.get("name"),
-            "picture": user_info.get("picture")
+            "email": claims.get("email"),
+            "name": claims.get("name"),
+            "picture": claims.get("picture")
         }
 
         # URL encode the data to pass to frontend
@@ -153,9 +169,8 @@ async def import_preview_endpoint(file: UploadFile):
         raise HTTPException(400, "File must be a CSV")
 
     try:
-        content = (await file.read()).decode('utf-8')
-        transactions = parse_csv_content(content)
-        return preview_all_transactions(transactions)
+        transactions = await asyncio.to_thread(parse_csv_stream, file.file)
+        return await preview_all_transactions(transactions)
     except Exception as e:
         raise HTTPException(500, str(e))
 
@@ -168,6 +183,6 @@ class CommitRequest(BaseModel):
 async def import_commit_endpoint(body: CommitRequest):
     """Write user-approved preview rows to the sheet."""
     try:
-        return commit_all_previews(body.previews)
+        return await asyncio.to_thread(commit_all_previews, body.previews)
     except Exception as e:
         raise HTTPException(500, str(e))
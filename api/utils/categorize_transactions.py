@@ -1,47 +1,50 @@
 """Transaction categorization using Claude with enforced category enums."""
 
-import json
+import re
+import time
+from functools import lru_cache
 from textwrap import dedent
 
 import anthropic
+import orjson
 
-from .helper import get_sheets_service, find_expense_section
+from .helper import MONTH_RANGES, execute_with_backoff, get_sheets_service, find_expense_section
 
 
 def fetch_historical_expenses(spreadsheet_id: str, worksheet_name: str) -> list[dict]:
-    """Fetch historical expense entries (name + category) from the given year's sheet."""
+    """Fetch historical expense entries (name + category) from the given year's sheet.
+
+    All twelve month ranges come back in a single batchGet instead of one
+    round trip per month.
+    """
     service = get_sheets_service()
 
-    month_columns = {
-        1: "A:D", 2: "E:H", 3: "I:L", 4: "M:P", 5: "Q:T", 6: "U:X",
-        7: "Y:AB", 8: "AC:AF", 9: "AG:AJ", 10: "AK:AN", 11: "AO:AR", 12: "AS:AV"
-    }
+    ranges = [f"{worksheet_name}!{start}:{end}" for start, end in MONTH_RANGES]
+    try:
+        response = execute_with_backoff(service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=ranges
+        ))
+    except Exception:
+        return []
 
     historical = []
 
-    for col_range in month_columns.values():
-        try:
-            result = service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=f"{worksheet_name}!{col_range}"
-            ).execute()
-            values = result.get('values', [])
-
-            in_expense_section = False
-            for row in values:
-                if len(row) >= 3 and row[0] == "Date" and row[2] == "Expense":
-                    in_expense_section = True
-                    continue
-                if in_expense_section:
-                    if len(row) >= 1 and row[0] == "Total":
-                        break
-                    if len(row) >= 4 and row[2] and row[3]:
-                        historical.append({
-                            "expense_name": row[2],
-                            "category": row[3]
-                        })
-        except Exception:
-            continue
+    for value_range in response.get('valueRanges', []):
+        values = value_range.get('values', [])
+
+        in_expense_section = False
+        for row in values:
+            if len(row) >= 3 and row[0] == "Date" and row[2] == "Expense":
+                in_expense_section = True
+                continue
+            if in_expense_section:
+                if len(row) >= 1 and row[0] == "Total":
+                    break
+                if len(row) >= 4 and row[2] and row[3]:
+                    historical.append({
+                        "expense_name": row[2],
+                        "category": row[3]
+                    })
 
     seen = set()
     unique = []
@@ -53,45 +56,158 @@ def fetch_historical_expenses(spreadsheet_id: str, worksheet_name: str) -> list[
     return unique
 
 
+# The dropdown rule changes rarely, so cache it briefly across requests;
+# the TTL keeps a warm instance from serving stale categories for long
+# after the sheet is edited.
+_CATEGORIES_TTL_SECONDS = 300
+_categories_cache: dict[tuple[str, str], tuple[float, list[str]]] = {}
+
+
 def fetch_categories(spreadsheet_id: str, worksheet_name: str) -> list[str]:
     """Fetch valid categories from the expense dropdown in column D."""
+    cache_key = (spreadsheet_id, worksheet_name)
+    cached = _categories_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < _CATEGORIES_TTL_SECONDS:
+        return cached[1]
+
     service = get_sheets_service()
 
-    values_response = service.spreadsheets().values().get(
+    # A single includeGridData read returns both the cell values (to locate
+    # the Expense header) and the validation rules, replacing the previous
+    # values.get followed by a second spreadsheets.get for the dropdown cell.
+    # The fields mask keeps the grid payload to just those two per-cell parts.
+    response = execute_with_backoff(service.spreadsheets().get(
         spreadsheetId=spreadsheet_id,
-        range=f"{worksheet_name}!A:D",
-    ).execute()
-    values = values_response.get("values", [])
-    header_row, _ = find_expense_section(values)
+        includeGridData=True,
+        ranges=[f"{worksheet_name}!A:D"],
+        fields="sheets(data(rowData(values(formattedValue,dataValidation))))",
+    ))
+
+    try:
+        row_data = response["sheets"][0]["data"][0].get("rowData", [])
+    except (KeyError, IndexError):
+        raise ValueError("Invalid response structure or missing dropdown data")
 
-    category_row = header_row + 2
-    range_name = f"{worksheet_name}!D{category_row}:D{category_row}"
+    values = [
+        [cell.get("formattedValue", "") for cell in row.get("values", [])]
+        for row in row_data
+    ]
+    header_row, _, _ = find_expense_section(values)
 
-    response = service.spreadsheets().get(
-        spreadsheetId=spreadsheet_id,
-        includeGridData=True,
-        ranges=range_name,
-    ).execute()
+    # The dropdown lives in column D of the first row under the header
+    # (0-based here; the same cell the old A1-notation fetch targeted).
+    category_row = header_row + 1
 
     try:
-        cell = response["sheets"][0]["data"][0]["rowData"][0]["values"][0]
+        cell = row_data[category_row]["values"][3]
         validation = cell["dataValidation"]
         if validation["condition"]["type"] != "ONE_OF_LIST":
-            raise ValueError(f"Cell {range_name} is not a dropdown")
-        return [v.get("userEnteredValue", "") for v in validation["condition"]["values"]]
+            raise ValueError(f"Cell {worksheet_name}!D{category_row + 1} is not a dropdown")
+        categories = [v.get("userEnteredValue", "") for v in validation["condition"]["values"]]
     except (KeyError, IndexError, TypeError):
         raise ValueError("Invalid response structure or missing dropdown data")
 
+    _categories_cache[cache_key] = (time.monotonic(), categories)
+    return categories
+
+
+@lru_cache(maxsize=8)
+def _build_historical_matcher(entries: tuple[tuple[str, str], ...]):
+    """Build exact and substring lookups over historical (name, category) pairs.
+
+    Exact matches accept any name; substring matches (e.g. "NETFLIX" inside
+    "NETFLIX.COM 866-555-1234") scan with a single compiled alternation,
+    longest name first so the most specific merchant wins, and only consider
+    names of 4+ characters so short ones don't match everywhere.
+    Cached on the entry tuple: every month of a year shares one history, so
+    the pattern compiles once per import instead of once per month.
+    Returns (exact, pattern, by_upper).
+    """
+    exact = {}
+    by_upper = {}
+    for expense_name, category in entries:
+        name = expense_name.strip()
+        if not name:
+            continue
+        entry = {"expense_name": expense_name, "category": category}
+        exact.setdefault(name.lower(), entry)
+        if len(name) >= 4:
+            by_upper.setdefault(name.upper(), entry)
+
+    pattern = None
+    if by_upper:
+        names = sorted(by_upper, key=len, reverse=True)
+        pattern = re.compile("|".join(re.escape(n) for n in names))
+    return exact, pattern, by_upper
+
 
 def categorize(
     transactions: list[str],
     valid_categories: list[str],
     historical_expenses: list[dict] | None = None,
 ) -> list[dict]:
-    """Categorize transactions using Claude with structured outputs."""
+    """Categorize transactions, short-circuiting recurring merchants.
+
+    Names that match a historical expense — exactly or as a substring of the
+    raw statement name — reuse its name and category directly; only unseen
+    names are sent to Claude.
+    """
     if not transactions:
         return []
 
+    exact, pattern, by_upper = {}, None, {}
+    if historical_expenses:
+        exact, pattern, by_upper = _build_historical_matcher(
+            tuple((e["expense_name"], e["category"]) for e in historical_expenses)
+        )
+
+    results: list[dict | None] = [None] * len(transactions)
+    unmatched: list[tuple[int, str]] = []
+    for i, name in enumerate(transactions):
+        hit = exact.get(name.strip().lower())
+        if hit is None and pattern is not None:
+            # Scan all hits and keep the longest so "UBER EATS" beats "UBER"
+            # regardless of where each occurs in the raw name.
+            best = None
+            for match in pattern.finditer(name.upper()):
+                matched = match.group(0)
+                if best is None or len(matched) > len(best):
+                    best = matched
+            if best is not None:
+                hit = by_upper[best]
+        if hit is not None and hit["category"] in valid_categories:
+            results[i] = {
+                "actual_name": name,
+                "expense_name": hit["expense_name"],
+                "category": hit["category"],
+            }
+        else:
+            unmatched.append((i, name))
+
+    if unmatched:
+        # A merchant often repeats within a month; send each distinct name
+        # once and fan the result back out to every occurrence.
+        unique_names = list(dict.fromkeys(name for _, name in unmatched))
+        categorized = _categorize_with_claude(
+            unique_names, valid_categories, historical_expenses
+        )
+        by_input = dict(zip(unique_names, categorized))
+        for i, name in unmatched:
+            results[i] = by_input.get(name) or {
+                "actual_name": name,
+                "expense_name": name,
+                "category": "NEED MANUAL ENTRY",
+            }
+
+    return results
+
+
+def _categorize_with_claude(
+    transactions: list[str],
+    valid_categories: list[str],
+    historical_expenses: list[dict] | None = None,
+) -> list[dict]:
+    """Categorize transactions using Claude with structured outputs."""
     schema = {
         "type": "object",
         "properties": {
@@ -118,18 +234,18 @@ def categorize(
         examples = historical_expenses[:50]
         historical_context = dedent(f"""
             HISTORICAL EXAMPLES (use these as reference for naming and categorization):
-            {json.dumps(examples, indent=2)}
+            {orjson.dumps(examples, option=orjson.OPT_INDENT_2).decode()}
         """)
 
-    prompt = dedent(f"""
-        Categorize these transactions.
+    # The categories + historical context are identical for every month of an
+    # import, so they live in a cached system block; only the month's
+    # transactions vary per request.
+    system_prompt = dedent(f"""
+        Categorize the transactions you are given.
 
         VALID CATEGORIES (must use exactly one):
-        {json.dumps(valid_categories)}
+        {orjson.dumps(valid_categories).decode()}
         {historical_context}
-        TRANSACTIONS TO CATEGORIZE:
-        {json.dumps(transactions)}
-
         Return actual_name (exact original), expense_name (short readable name), and category.
 
         IMPORTANT:
@@ -137,14 +253,24 @@ def categorize(
         - If you are unsure about the category for a transaction, use "NEED MANUAL ENTRY" instead of guessing.
     """)
 
+    prompt = dedent(f"""
+        TRANSACTIONS TO CATEGORIZE:
+        {orjson.dumps(transactions).decode()}
+    """)
+
     client = anthropic.Anthropic()
     response = client.beta.messages.create(
         model="claude-haiku-4-5",
         max_tokens=4096,
         betas=["structured-outputs-2025-11-13"],
+        system=[{
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"},
+        }],
         messages=[{"role": "user", "content": prompt}],
         output_format={"type": "json_schema", "schema": schema},
     )
 
-    result = json.loads(response.content[0].text)
+    result = orjson.loads(response.content[0].text)
     return result["transactions"]
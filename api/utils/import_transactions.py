@@ -1,13 +1,19 @@
-from datetime import datetime, timedelta
+import asyncio
+import csv
+import io
+import logging
+from datetime import date, datetime
 from googleapiclient.errors import HttpError
 import re
 import sys
 from collections import defaultdict
 
 from .categorize_transactions import fetch_categories, fetch_historical_expenses, categorize
-from .helper import format_amount, format_date_short, get_column_range, get_sheets_service, load_csv, parse_date, find_expense_section
+from .helper import MONTH_RANGES, execute_with_backoff, format_amount, format_date_short, get_column_range, get_sheets_service, load_csv, parse_date, find_expense_section
 
 
+logger = logging.getLogger(__name__)
+
 SPREADSHEET_ID = "1R-LLdpkVxjewiRD6LNer7sUF_AtJfx1_b6G1VPddc9k"
 REFUND_WINDOW_DAYS = 14
 SHEET_REFUND_WINDOW_DAYS = 60
@@ -20,8 +26,8 @@ def _name_tokens(name: str) -> set[str]:
 
 
 def _days_between(d1: str, d2: str) -> int:
-    a = datetime.strptime(d1, "%Y-%m-%d")
-    b = datetime.strptime(d2, "%Y-%m-%d")
+    a = date(*parse_date(d1))
+    b = date(*parse_date(d2))
     return abs((a - b).days)
 
 
@@ -30,13 +36,22 @@ def pair_refunds(transactions: list[dict]) -> tuple[list[dict], list[dict], list
 
     Returns (kept_debits, refund_pairs, unmatched_credits).
     """
-    debits = [t for t in transactions if t['amount'] < 0]
-    credits = [t for t in transactions if t['amount'] > 0]
+    debits: list[dict] = []
+    credits: list[dict] = []
+    for t in transactions:
+        if t['amount'] < 0:
+            debits.append(t)
+        elif t['amount'] > 0:
+            credits.append(t)
 
     paired_debits: set[int] = set()
     pairs: list[dict] = []
     unmatched_credits: list[dict] = []
 
+    # Token sets are tokenized lazily but kept, so a debit compared against
+    # several credits is only tokenized once.
+    debit_tokens: list[set[str] | None] = [None] * len(debits)
+
     for credit in credits:
         c_tokens = _name_tokens(credit['name'])
         c_amount = abs(credit['amount'])
@@ -48,8 +63,12 @@ def pair_refunds(transactions: list[dict]) -> tuple[list[dict], list[dict], list
                 continue
             if _days_between(credit['date'], debit['date']) > REFUND_WINDOW_DAYS:
                 continue
-            if c_tokens and not (c_tokens & _name_tokens(debit['name'])):
-                continue
+            if c_tokens:
+                d_tokens = debit_tokens[di]
+                if d_tokens is None:
+                    d_tokens = debit_tokens[di] = _name_tokens(debit['name'])
+                if not (c_tokens & d_tokens):
+                    continue
             match_idx = di
             break
 
@@ -63,47 +82,49 @@ def pair_refunds(transactions: list[dict]) -> tuple[list[dict], list[dict], list
     return kept_debits, pairs, unmatched_credits
 
 
-def get_existing_expenses(values: list[list], header_row: int | None, last_row: int | None) -> set[tuple]:
-    """Extract existing expenses for duplicate checking (date, amount)."""
-    existing = set()
-
-    if header_row is None:
-        return existing
-
-    start = header_row + 1
-    end = (last_row + 1) if last_row else start
-
-    for i in range(start, end + 1):
-        if i < len(values):
-            row = values[i]
-            if len(row) >= 2 and row[0] and row[0] != "Total":
-                existing.add((row[0], row[1]))
-
-    return existing
-
-
 def group_transactions_by_year_and_month(transactions: list[dict]) -> dict[int, dict[int, list[dict]]]:
     """Group transactions by year, then by month."""
     by_year_month: dict[int, dict[int, list[dict]]] = defaultdict(lambda: defaultdict(list))
     for txn in transactions:
-        year, month, _ = parse_date(txn['date'])
-        by_year_month[year][month].append(txn)
+        by_year_month[txn['year']][txn['month']].append(txn)
 
     return {year: dict(months) for year, months in by_year_month.items()}
 
 
-def get_sheet_id(service, spreadsheet_id: str, sheet_name: str) -> int:
-    """Get the sheet ID for a given sheet name."""
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    for sheet in spreadsheet['sheets']:
-        if sheet['properties']['title'] == sheet_name:
-            return sheet['properties']['sheetId']
-    raise ValueError(f"Sheet '{sheet_name}' not found")
+# Sheet IDs are stable, so the title -> sheetId map is cached per spreadsheet
+# for the life of the process.
+_sheet_ids_cache: dict[str, dict[str, int]] = {}
+
+
+def get_sheet_ids(service, spreadsheet_id: str, refresh: bool = False) -> dict[str, int]:
+    """Get the title -> sheetId map in a single metadata call, cached.
+
+    The fields mask keeps the response to bare sheet properties instead of
+    the full spreadsheet metadata. Pass refresh=True to bypass the cache,
+    e.g. after a lookup misses a newly added year sheet.
+    """
+    sheet_ids = None if refresh else _sheet_ids_cache.get(spreadsheet_id)
+    if sheet_ids is None:
+        spreadsheet = execute_with_backoff(service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields="sheets(properties(sheetId,title))",
+        ))
+        sheet_ids = {
+            sheet['properties']['title']: sheet['properties']['sheetId']
+            for sheet in spreadsheet['sheets']
+        }
+        _sheet_ids_cache[spreadsheet_id] = sheet_ids
+    return sheet_ids
 
 
 def rows_to_tsv(rows: list[list]) -> str:
-    """Convert 2D array to tab-separated string."""
-    return "\n".join("\t".join(str(cell) for cell in row) for row in rows)
+    """Convert 2D array to tab-separated string.
+
+    csv.writer emits rows in C, avoiding per-cell Python string dispatch.
+    """
+    buf = io.StringIO()
+    csv.writer(buf, delimiter='\t', lineterminator='\n').writerows(rows)
+    return buf.getvalue().rstrip('\n')
 
 
 def col_letter_to_index(col: str) -> int:
@@ -114,10 +135,16 @@ def col_letter_to_index(col: str) -> int:
     return result - 1
 
 
-def paste_rows(service, spreadsheet_id: str, sheet_id: int, start_col: str, row_start: int, rows: list[list]):
-    """Paste rows into the sheet at the given coordinate."""
-    col_start_index = col_letter_to_index(start_col)
-    requests = [{
+# Start-column indices for the known month columns, resolved at import time.
+COL_INDEX = {start: col_letter_to_index(start) for start, _ in MONTH_RANGES}
+
+
+def build_paste_request(sheet_id: int, start_col: str, row_start: int, rows: list[list]) -> dict:
+    """Build a pasteData request for the given sheet coordinate."""
+    col_start_index = COL_INDEX.get(start_col)
+    if col_start_index is None:
+        col_start_index = col_letter_to_index(start_col)
+    return {
         "pasteData": {
             "coordinate": {
                 "sheetId": sheet_id,
@@ -128,11 +155,7 @@ def paste_rows(service, spreadsheet_id: str, sheet_id: int, start_col: str, row_
             "type": "PASTE_NORMAL",
             "delimiter": "\t",
         }
-    }]
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body={"requests": requests},
-    ).execute()
+    }
 
 
 def _match_credits_to_sheet(unmatched_credits: list[dict], existing: set[tuple], sheet_year: int) -> list[dict]:
@@ -148,7 +171,7 @@ def _match_credits_to_sheet(unmatched_credits: list[dict], existing: set[tuple],
 
     for credit in unmatched_credits:
         c_amount_fmt = format_amount(credit['amount'])
-        c_date = datetime.strptime(credit['date'], "%Y-%m-%d")
+        c_date = datetime(*parse_date(credit['date']))
         for ex_date, ex_amount in existing_parsed:
             if ex_amount != c_amount_fmt:
                 continue
@@ -165,30 +188,20 @@ def _match_credits_to_sheet(unmatched_credits: list[dict], existing: set[tuple],
     return warnings
 
 
-def preview_month(service, spreadsheet_id: str, sheet_name: str, month: int, transactions: list[dict], unmatched_credits: list[dict] | None = None) -> dict | None:
+def preview_month(sheet_name: str, month: int, transactions: list[dict], values: list[list], valid_categories: list[str], historical: list[dict], unmatched_credits: list[dict] | None = None) -> dict | None:
     """Build a preview for a single month without writing to the sheet.
 
+    Operates on `values`, `valid_categories` and `historical` pre-fetched by
+    the caller (once per year rather than once per month).
     Returns a dict with target coordinates, classified rows, and the category list,
     or None if the month's Expense section can't be located.
     """
-    start_col, end_col = get_column_range(month)
-    range_name = f"{sheet_name}!{start_col}:{end_col}"
-
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id, range=range_name
-        ).execute()
-        values = result.get('values', [])
-    except HttpError as e:
-        print(f"Error reading sheet: {e}")
-        return None
+    start_col, _ = get_column_range(month)
 
-    header_row, last_expense_row = find_expense_section(values)
+    header_row, last_expense_row, existing = find_expense_section(values)
     if header_row is None:
         return None
 
-    existing = get_existing_expenses(values, header_row, last_expense_row)
-
     # Sort ascending (earliest -> latest) so commits write oldest rows first
     # to the sheet. Frontend reverses for display.
     transactions = sorted(transactions, key=lambda t: t['date'])
@@ -210,10 +223,7 @@ def preview_month(service, spreadsheet_id: str, sheet_name: str, month: int, tra
         if entry['status'] != 'duplicate':
             new_entries.append(entry)
 
-    valid_categories = fetch_categories(spreadsheet_id, sheet_name)
-
     if new_entries:
-        historical = fetch_historical_expenses(spreadsheet_id, sheet_name)
         names = [t['raw_name'] for t in new_entries]
         categorized = categorize(names, valid_categories, historical)
         for entry, cat in zip(new_entries, categorized):
@@ -227,6 +237,13 @@ def preview_month(service, spreadsheet_id: str, sheet_name: str, month: int, tra
         unmatched_credits or [], existing, int(sheet_name)
     ) if unmatched_credits else []
 
+    # One aggregate line per month rather than a line per row.
+    logger.debug(
+        "%s month %d: %d rows (%d new, %d duplicate)",
+        sheet_name, month, len(ordered_rows), len(new_entries),
+        len(ordered_rows) - len(new_entries),
+    )
+
     return {
         'sheet_name': sheet_name,
         'month': month,
@@ -238,42 +255,98 @@ def preview_month(service, spreadsheet_id: str, sheet_name: str, month: int, tra
     }
 
 
-def commit_month(service, spreadsheet_id: str, sheet_name: str, start_col: str, insert_row: int, rows: list[dict]) -> int:
-    """Write user-approved rows to the sheet. Returns count written."""
+def commit_month(sheet_id: int, start_col: str, insert_row: int, rows: list[dict]) -> tuple[dict | None, int]:
+    """Build the paste request for one month's user-approved rows.
+
+    Returns (pasteData request or None, row count); the caller batches the
+    requests into a single batchUpdate.
+    """
     if not rows:
-        return 0
+        return None, 0
 
-    sheet_id = get_sheet_id(service, spreadsheet_id, sheet_name)
     table = [
         [r['date_short'], r['amount_fmt'], r['expense_name'], r['category']]
         for r in rows
     ]
-    paste_rows(service, spreadsheet_id, sheet_id, start_col, insert_row, table)
-    return len(table)
+    return build_paste_request(sheet_id, start_col, insert_row, table), len(table)
+
 
+async def preview_all_transactions(transactions: list[dict]) -> dict:
+    """Build previews for all months across all years in the CSV.
 
-def preview_all_transactions(transactions: list[dict]) -> dict:
-    """Build previews for all months across all years in the CSV."""
+    Months are processed concurrently on the default thread pool so their
+    Sheets and Anthropic round-trips overlap instead of summing.
+    """
     if not transactions:
         return {"previews": [], "refunds_paired": []}
 
     kept_debits, refund_pairs, unmatched_credits = pair_refunds(transactions)
     by_year_month = group_transactions_by_year_and_month(kept_debits)
-    service = get_sheets_service()
 
     previews = []
-    for year in sorted(by_year_month.keys(), reverse=True):
+    for year, months_map in sorted(by_year_month.items(), reverse=True):
         sheet_name = str(year)
-        credits_for_year = [c for c in unmatched_credits if parse_date(c['date'])[0] == year]
-        for month in sorted(by_year_month[year].keys(), reverse=True):
-            credits_for_month = [
-                c for c in credits_for_year if parse_date(c['date'])[1] == month
-            ]
-            preview = preview_month(
-                service, SPREADSHEET_ID, sheet_name, month,
-                by_year_month[year][month],
-                credits_for_month or None,
+        credits_for_year = [c for c in unmatched_credits if c['year'] == year]
+        months = sorted(months_map, reverse=True)
+
+        # One batchGet per year instead of one values.get per month.
+        ranges = []
+        for month in months:
+            start_col, end_col = get_column_range(month)
+            ranges.append(f"{sheet_name}!{start_col}:{end_col}")
+        def _read_month_values():
+            try:
+                result = execute_with_backoff(
+                    get_sheets_service().spreadsheets().values().batchGet(
+                        spreadsheetId=SPREADSHEET_ID, ranges=ranges
+                    )
+                )
+                return {
+                    month: value_range.get('values', [])
+                    for month, value_range in zip(months, result.get('valueRanges', []))
+                }
+            except HttpError as e:
+                logger.warning("Error reading sheet: %s", e)
+                return {}
+
+        # The three per-year reads (month values, categories, historical
+        # context) are independent; run them concurrently so the year's setup
+        # costs one round trip instead of three. Categories and historical
+        # context are identical for every month of a year, so they are fetched
+        # once here rather than inside each preview_month. A year whose sheet
+        # doesn't exist yet (or has no Expense header) degrades to per-month
+        # placeholder entries instead of failing the whole preview.
+        try:
+            month_values, valid_categories, historical = await asyncio.gather(
+                asyncio.to_thread(_read_month_values),
+                asyncio.to_thread(fetch_categories, SPREADSHEET_ID, sheet_name),
+                asyncio.to_thread(fetch_historical_expenses, SPREADSHEET_ID, sheet_name),
             )
+        except (HttpError, ValueError, TypeError) as e:
+            logger.warning("Skipping year %s: %s", sheet_name, e)
+            for month in months:
+                previews.append({
+                    'sheet_name': sheet_name,
+                    'month': month,
+                    'error': f"Could not locate Expense section in sheet '{sheet_name}' for month {month}",
+                    'rows': [],
+                    'sheet_refund_warnings': [],
+                })
+            continue
+
+        month_previews = await asyncio.gather(*[
+            asyncio.to_thread(
+                preview_month, sheet_name, month,
+                months_map[month],
+                month_values.get(month, []),
+                valid_categories,
+                historical,
+                [c for c in credits_for_year if c['month'] == month] or None,
+            )
+            for month in months
+        ])
+
+        for month, preview in zip(months, month_previews):
             if preview is None:
                 previews.append({
                     'sheet_name': sheet_name,
@@ -303,19 +376,27 @@ def preview_all_transactions(transactions: list[dict]) -> dict:
 def commit_all_previews(previews: list[dict]) -> dict:
     """Commit user-approved previews to the sheet."""
     service = get_sheets_service()
+    sheet_ids = get_sheet_ids(service, SPREADSHEET_ID)
+    requests = []
     results = []
     total = 0
 
     for preview in previews:
+        sheet_name = preview['sheet_name']
+        if sheet_name not in sheet_ids:
+            # A year sheet may have been added since the map was cached.
+            sheet_ids = get_sheet_ids(service, SPREADSHEET_ID, refresh=True)
+        if sheet_name not in sheet_ids:
+            raise ValueError(f"Sheet '{sheet_name}' not found")
         rows = [r for r in preview.get('rows', []) if r.get('status') in ('new', 'needs_manual')]
-        added = commit_month(
-            service,
-            SPREADSHEET_ID,
-            preview['sheet_name'],
+        request, added = commit_month(
+            sheet_ids[sheet_name],
             preview['start_col'],
             preview['insert_row'],
             rows,
         )
+        if request is not None:
+            requests.append(request)
         results.append({
             'sheet_name': preview['sheet_name'],
             'month': preview['month'],
@@ -323,20 +404,28 @@ def commit_all_previews(previews: list[dict]) -> dict:
         })
         total += added
 
+    # One batchUpdate for the whole commit instead of one per month.
+    if requests:
+        execute_with_backoff(service.spreadsheets().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={"requests": requests},
+        ))
+
     return {"total_added": total, "results": results}
 
 
 def main(csv_path: str):
     """CLI entry point: preview + auto-commit (no manual review)."""
-    print(f"Reading CSV: {csv_path}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("Reading CSV: %s", csv_path)
     transactions = load_csv(csv_path)
-    print(f"Found {len(transactions)} purchase transactions")
+    logger.info("Found %d purchase transactions", len(transactions))
     if not transactions:
         return
 
-    preview = preview_all_transactions(transactions)
+    preview = asyncio.run(preview_all_transactions(transactions))
     result = commit_all_previews(preview["previews"])
-    print(f"\n=== Done! Added {result['total_added']} total transactions ===")
+    logger.info("\n=== Done! Added %d total transactions ===", result['total_added'])
 
 
 if __name__ == "__main__":